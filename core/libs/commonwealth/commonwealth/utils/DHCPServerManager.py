@@ -1,16 +1,35 @@
+import functools
+import os
 import pathlib
 import shutil
+import signal
 import subprocess
 from typing import Any, Optional, Union
 
 from loguru import logger
 
 
+@functools.lru_cache(maxsize=None)
+def _find_binary(name: str) -> Optional[str]:
+    """Look for the binary on the system's PATH, only once per binary name."""
+    return shutil.which(name)
+
+
+@functools.lru_cache(maxsize=1)
+def _probe_binary(binary: pathlib.Path) -> None:
+    """Run the binary once to check that it works, raising if it does not.
+    The result is cached since the same binary is probed by every Dnsmasq instance."""
+    subprocess.run([binary, "--version"], stdout=subprocess.DEVNULL, check=True)
+
+
 class Dnsmasq:
+    # How long, in seconds, dnsmasq has to exit after SIGTERM before being killed
+    STOP_TIMEOUT = 2.0
+
     def __init__(self, config_path: pathlib.Path) -> None:
         self._subprocess: Optional[Any] = None
 
-        binary_path = shutil.which(self.binary_name())
+        binary_path = _find_binary(self.binary_name())
         if binary_path is None:
             logger.error("Dnsmasq binary not found on system's PATH.")
             raise ValueError
@@ -19,6 +38,12 @@ class Dnsmasq:
         assert self.is_binary_working()
 
         self._config_path = config_path
+        # Both the binary and the configuration file are fixed, so the command only needs to be built once
+        self._command_list: list[Union[str, pathlib.Path]] = [
+            self.binary(),
+            "--no-daemon",
+            f"--conf-file={self.config_path()}",
+        ]
         assert self.is_valid_config_file()
 
     @staticmethod
@@ -29,11 +54,8 @@ class Dnsmasq:
         return self._binary
 
     def is_binary_working(self) -> bool:
-        if self.binary() is None:
-            return False
-
         try:
-            subprocess.check_output([self.binary()])
+            _probe_binary(self.binary())
             return True
         except subprocess.CalledProcessError as error:
             logger.error(f"Invalid binary: {error}")
@@ -44,19 +66,22 @@ class Dnsmasq:
 
     def is_valid_config_file(self) -> bool:
         try:
-            subprocess.check_output([*self.command_list(), "--test"])
+            subprocess.run([*self.command_list(), "--test"], stdout=subprocess.DEVNULL, check=True)
             return True
         except subprocess.CalledProcessError as error:
             logger.error(f"Invalid configuration file: {error}")
             return False
 
     def command_list(self) -> list[Union[str, pathlib.Path]]:
-        return [self.binary(), "--no-daemon", f"--conf-file={self.config_path()}"]
+        return self._command_list
 
     def start(self) -> None:
         try:
+            # Run it in its own session, so its whole process group can be signaled when stopping
             # pylint: disable=consider-using-with
-            self._subprocess = subprocess.Popen(self.command_list(), shell=False, encoding="utf-8", errors="ignore")
+            self._subprocess = subprocess.Popen(
+                self.command_list(), shell=False, encoding="utf-8", errors="ignore", start_new_session=True
+            )
             logger.info("DHCP Server started.")
         except Exception as error:
             logger.error(f"Unable to start DHCP Server: {error}")
@@ -64,11 +89,26 @@ class Dnsmasq:
     def stop(self) -> None:
         if self.is_running():
             assert self._subprocess is not None
-            self._subprocess.kill()
+            # The process is the leader of its own group, so the group id is its pid
+            self._signal_process_group(signal.SIGTERM)
+            try:
+                self._subprocess.wait(timeout=self.STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                logger.warning("DHCP Server did not stop in time, killing it.")
+                self._signal_process_group(signal.SIGKILL)
+                self._subprocess.wait()
             logger.info("DHCP Server stopped.")
         else:
             logger.info("Tried to stop DHCP Server, but it was already not running.")
 
+    def _signal_process_group(self, signal_number: signal.Signals) -> None:
+        assert self._subprocess is not None
+        try:
+            os.killpg(self._subprocess.pid, signal_number)
+        except ProcessLookupError:
+            # Everything in the group already exited
+            pass
+
     def restart(self) -> None:
         self.stop()
         self.start()
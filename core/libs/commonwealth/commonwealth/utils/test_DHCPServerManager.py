@@ -0,0 +1,39 @@
+import signal
+import subprocess
+from typing import Any, Tuple, cast
+
+import pytest
+from commonwealth.utils.DHCPServerManager import Dnsmasq
+
+
+def start_child(monkeypatch: pytest.MonkeyPatch, script: str) -> Tuple[Dnsmasq, "subprocess.Popen[bytes]"]:
+    """Create a Dnsmasq that manages a shell script instead of dnsmasq, started as Dnsmasq.start() does."""
+    monkeypatch.setattr(Dnsmasq, "STOP_TIMEOUT", 0.2)
+    # Skip __init__, it needs a dnsmasq binary and a valid configuration file
+    dnsmasq = cast(Dnsmasq, object.__new__(Dnsmasq))
+    # pylint: disable=consider-using-with
+    process = subprocess.Popen(
+        ["sh", "-c", f"{script}; echo ready; exec sleep 60"], stdout=subprocess.PIPE, start_new_session=True
+    )
+    dnsmasq._subprocess = cast(Any, process)
+    # Wait for the script to run, so signals are only sent after any trap is in place
+    assert process.stdout is not None and process.stdout.readline() == b"ready\n"
+    assert dnsmasq.is_running()
+    return dnsmasq, process
+
+
+def test_stop(monkeypatch: pytest.MonkeyPatch) -> None:
+    dnsmasq, process = start_child(monkeypatch, "true")
+    dnsmasq.stop()
+
+    assert not dnsmasq.is_running()
+    assert process.returncode == -signal.SIGTERM
+
+
+def test_stop_ignoring_sigterm(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Ignored signals stay ignored across exec, so sleep ignores SIGTERM as well
+    dnsmasq, process = start_child(monkeypatch, "trap '' TERM")
+    dnsmasq.stop()
+
+    assert not dnsmasq.is_running()
+    assert process.returncode == -signal.SIGKILL
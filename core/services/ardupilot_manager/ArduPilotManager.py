@@ -1,9 +1,14 @@
+import fcntl
 import os
 import shutil
+import struct
 import subprocess
+import termios
+import threading
 import time
-from copy import deepcopy
-from typing import Any, List, Optional, Set, Tuple
+from contextlib import contextmanager
+from operator import itemgetter
+from typing import Any, Iterator, List, Optional, Set, Tuple
 
 from loguru import logger
 
@@ -17,6 +22,20 @@ from Singleton import Singleton
 
 
 class ArduPilotManager(metaclass=Singleton):
+    # Delays, in seconds, before starting ArduPilot again after it exits.
+    # The delay doubles while ArduPilot keeps exiting shortly after starting, to not hammer a broken firmware.
+    MIN_RESTART_DELAY = 1.0
+    MAX_RESTART_DELAY = 60.0
+    # Time, in seconds, that ArduPilot has to stay up for the restart delay to go back to the minimum
+    STABLE_UPTIME = 30.0
+    # Endpoints that should always exist
+    DEFAULT_ENDPOINTS = frozenset(
+        {
+            Endpoint("GCS Link", Settings.app_name, EndpointType.UDPClient, "192.168.2.1", 14550, protected=True),
+            Endpoint("MAVLink2Rest", Settings.app_name, EndpointType.UDPClient, "127.0.0.1", 14000, protected=True),
+        }
+    )
+
     def __init__(self) -> None:
         self.settings = Settings()
         self.mavlink_manager = MavlinkManager()
@@ -29,7 +48,10 @@ class ArduPilotManager(metaclass=Singleton):
         else:
             self.settings.create_settings_file()
 
-        self.configuration = deepcopy(self.settings.content)
+        # Configuration keys are only ever replaced, never mutated in place, so a shallow copy is enough
+        self.configuration = dict(self.settings.content)
+        self._endpoints_batch_depth = 0
+        self._endpoints_batch_changed = False
         self._load_endpoints()
         self.subprocess: Optional[Any] = None
         self.firmware_download = FirmwareDownload()
@@ -37,9 +59,36 @@ class ArduPilotManager(metaclass=Singleton):
     def run_with_board(self) -> None:
         ArduPilotManager.check_running_as_root()
 
+        # Serial flight controllers show up as tty devices, so we wake up as soon as udev reports one
+        # instead of blindly waiting for the next detection attempt.
+        # Navigator is detected over I²C and generates no udev events, the timeout takes care of it.
+        # The monitor has no stop method, its netlink socket is closed once it goes out of scope.
+        monitor = ArduPilotManager._tty_monitor()
         while not self.start_board(BoardDetector.detect()):
             logger.warning("Flight controller board not detected, will try again.")
-            time.sleep(2)
+            if monitor is None:
+                time.sleep(2)
+                continue
+            try:
+                monitor.poll(timeout=2)
+            except EnvironmentError as error:
+                logger.warning(f"Could not read udev events, falling back to periodic detection: {error}")
+                monitor = None
+                time.sleep(2)
+
+    @staticmethod
+    def _tty_monitor() -> Optional[Any]:
+        try:
+            # Imported here so a system without libudev also falls back to periodic detection
+            import pyudev  # pylint: disable=import-outside-toplevel
+
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by(subsystem="tty")
+            monitor.start()
+            return monitor
+        except Exception as error:
+            logger.warning(f"Could not monitor udev events, falling back to periodic detection: {error}")
+            return None
 
     @staticmethod
     def check_running_as_root() -> None:
@@ -58,11 +107,6 @@ class ArduPilotManager(metaclass=Singleton):
             "Master", self.settings.app_name, EndpointType.UDPServer, "127.0.0.1", 8852, protected=True
         )
 
-        # Run ardupilot inside while loop to avoid exiting after reboot command
-        ## Can be changed back to a simple command after https://github.com/ArduPilot/ardupilot/issues/17572
-        ## gets fixed.
-        # pylint: disable=consider-using-with
-        #
         # The mapping of serial ports works as in the following table:
         #
         # |    ArduSub   |       Navigator         |
@@ -72,25 +116,78 @@ class ArduPilotManager(metaclass=Singleton):
         # | -F = Serial5 | Serial5 => /dev/ttyAMA3 |
         #
         # The first column comes from https://ardupilot.org/dev/docs/sitl-serial-mapping.html
-
-        self.subprocess = subprocess.Popen(
-            "while true; do "
-            f"{firmware} -A udp:{master_endpoint.place}:{master_endpoint.argument}"
-            f" --log-directory {self.settings.firmware_path}/logs/"
-            f" --storage-directory {self.settings.firmware_path}/storage/"
-            f" -C /dev/ttyS0"
-            f" -B /dev/ttyAMA1"
-            f" -E /dev/ttyAMA2"
-            f" -F /dev/ttyAMA3"
-            "; sleep 1; done",
-            shell=True,
-            encoding="utf-8",
-            errors="ignore",
-        )
+        command = [
+            firmware,
+            "-A",
+            f"udp:{master_endpoint.place}:{master_endpoint.argument}",
+            "--log-directory",
+            f"{self.settings.firmware_path}/logs/",
+            "--storage-directory",
+            f"{self.settings.firmware_path}/storage/",
+            "-C",
+            "/dev/ttyS0",
+            "-B",
+            "/dev/ttyAMA1",
+            "-E",
+            "/dev/ttyAMA2",
+            "-F",
+            "/dev/ttyAMA3",
+        ]
+
+        # Keep ardupilot running to avoid exiting after reboot command
+        ## Can be changed back to a simple command after https://github.com/ArduPilot/ardupilot/issues/17572
+        ## gets fixed.
+        threading.Thread(target=self._keep_running, args=(command,), name="ardupilot-navigator", daemon=True).start()
 
         self.start_mavlink_manager(master_endpoint)
 
+    def _keep_running(self, command: List[str]) -> None:
+        """Run the command without a shell in between, starting it again whenever it exits."""
+        restart_delay = self.MIN_RESTART_DELAY
+        while True:
+            start_time = time.monotonic()
+            try:
+                # pylint: disable=consider-using-with
+                self.subprocess = subprocess.Popen(command, shell=False)
+                return_code = self.subprocess.wait()
+                logger.warning(f"ArduPilot exited with code {return_code}.")
+            except OSError as error:
+                # A broken or missing binary counts as a failed run, so it is retried with backoff as well
+                logger.error(f"Could not start ArduPilot: {error}")
+            if time.monotonic() - start_time > self.STABLE_UPTIME:
+                restart_delay = self.MIN_RESTART_DELAY
+            logger.info(f"Starting ArduPilot again in {restart_delay} seconds.")
+            time.sleep(restart_delay)
+            restart_delay = min(2 * restart_delay, self.MAX_RESTART_DELAY)
+
+    @staticmethod
+    def _set_serial_low_latency(device: str) -> None:
+        """Ask the serial driver to hand over received data right away instead of buffering it.
+        USB serial converters like FTDI otherwise hold data for up to 16 ms, delaying every MAVLink message.
+        This is the same as `setserial <device> low_latency`.
+
+        Args:
+            device (str): Path of the serial device
+        """
+        # Flags are the 5th int of linux's struct serial_struct, the buffer is bigger than the struct on purpose
+        flags_offset = 4 * struct.calcsize("i")
+        async_low_latency = 1 << 13
+        serial_info = bytearray(128)
+        try:
+            file_descriptor = os.open(device, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+            try:
+                fcntl.ioctl(file_descriptor, termios.TIOCGSERIAL, serial_info)
+                (flags,) = struct.unpack_from("i", serial_info, flags_offset)
+                struct.pack_into("i", serial_info, flags_offset, flags | async_low_latency)
+                fcntl.ioctl(file_descriptor, termios.TIOCSSERIAL, serial_info)
+                logger.info(f"Serial device {device} configured for low latency.")
+            finally:
+                os.close(file_descriptor)
+        except OSError as error:
+            logger.warning(f"Could not configure serial device {device} for low latency: {error}")
+
     def start_serial(self, device: str) -> None:
+        ArduPilotManager._set_serial_low_latency(device)
         self.start_mavlink_manager(
             Endpoint("Master", self.settings.app_name, EndpointType.Serial, device, 115200, protected=True)
         )
@@ -134,35 +231,18 @@ class ArduPilotManager(metaclass=Singleton):
                 "/dev/ttyAMA3",
             ],
             shell=False,
-            encoding="utf-8",
-            errors="ignore",
         )
 
         self.start_mavlink_manager(master_endpoint)
 
     def start_mavlink_manager(self, device: Endpoint) -> None:
+        missing_endpoints = set(self.DEFAULT_ENDPOINTS - self.get_endpoints())
         try:
-            self.add_new_endpoints(
-                {
-                    Endpoint(
-                        "GCS Link", self.settings.app_name, EndpointType.UDPClient, "192.168.2.1", 14550, protected=True
-                    )
-                }
-            )
-            self.add_new_endpoints(
-                {
-                    Endpoint(
-                        "MAVLink2Rest",
-                        self.settings.app_name,
-                        EndpointType.UDPClient,
-                        "127.0.0.1",
-                        14000,
-                        protected=True,
-                    )
-                }
-            )
+            # Add all of them at once, so the settings file is written and the router restarted only once
+            if missing_endpoints:
+                self.add_new_endpoints(missing_endpoints)
         except Exception as error:
-            logger.error(f"Could not create default GCS endpoint: {error}")
+            logger.error(f"Could not create default endpoints: {error}")
         self.mavlink_manager.set_master_endpoint(device)
         self.mavlink_manager.start()
 
@@ -173,10 +253,8 @@ class ArduPilotManager(metaclass=Singleton):
         if len(boards) > 1:
             logger.warning(f"More than a single board detected: {boards}")
 
-        # Sort by priority
-        boards.sort(key=lambda tup: tup[0].value)
-
-        flight_controller_type, place = boards[0]
+        # Take the one with highest priority, FlightControllerType values are ordered by priority
+        flight_controller_type, place = min(boards, key=itemgetter(0))
         logger.info(f"Board in use: {flight_controller_type.name}.")
 
         if FlightControllerType.Navigator == flight_controller_type:
@@ -213,6 +291,10 @@ class ArduPilotManager(metaclass=Singleton):
             logger.error(f"Error resetting endpoints: {error}")
 
     def _update_endpoints(self) -> None:
+        if self._endpoints_batch_depth > 0:
+            self._endpoints_batch_changed = True
+            return
+
         try:
             persistent_endpoints = set(filter(lambda endpoint: endpoint.persistent, self.get_endpoints()))
             self._save_endpoints_to_configuration(persistent_endpoints)
@@ -221,6 +303,24 @@ class ArduPilotManager(metaclass=Singleton):
         except Exception as error:
             logger.error(f"Error updating endpoints: {error}")
 
+    @contextmanager
+    def endpoints_batch(self) -> Iterator[None]:
+        """Group multiple endpoint changes, saving the settings file and restarting the router only once at the end.
+
+        Example:
+            with autopilot.endpoints_batch():
+                autopilot.add_new_endpoints(new_endpoints)
+                autopilot.remove_endpoints(old_endpoints)
+        """
+        self._endpoints_batch_depth += 1
+        try:
+            yield
+        finally:
+            self._endpoints_batch_depth -= 1
+            if not self._endpoints_batch_depth and self._endpoints_batch_changed:
+                self._endpoints_batch_changed = False
+                self._update_endpoints()
+
     def get_endpoints(self) -> Set[Endpoint]:
         """Get all endpoints from the mavlink manager."""
         return self.mavlink_manager.endpoints()
@@ -110,7 +110,7 @@ class AbstractRouter(metaclass=abc.ABCMeta):
         if endpoint in self._endpoints:
             raise ValueError("Endpoint already exists.")
 
-        if endpoint.name in [endpoint.name for endpoint in self._endpoints]:
+        if any(existing_endpoint.name == endpoint.name for existing_endpoint in self._endpoints):
             raise ValueError("Name already being used by an existing endpoint.")
 
         self._endpoints.add(endpoint)
@@ -1,5 +1,6 @@
+import dataclasses
 from enum import Enum
-from typing import Any, Dict, Optional, Type
+from typing import Any, Dict, Optional, Tuple, Type
 
 import validators
 from pydantic import constr, root_validator
@@ -58,16 +59,23 @@ class Endpoint:
         return ":".join([self.connection_type, self.place, str(self.argument)])
 
     def as_dict(self) -> Dict[str, Any]:
-        return dict(filter(lambda field: field[0] != "__initialised__", self.__dict__.items()))
+        return {field: getattr(self, field) for field in ENDPOINT_FIELDS}
+
+    def _connection_key(self) -> Tuple[str, str, Optional[int]]:
+        """Fields that identify an endpoint connection, cheaper to hash and compare than its string form."""
+        return (self.connection_type, self.place, self.argument)
 
     def __hash__(self) -> int:
-        return hash(str(self))
+        return hash(self._connection_key())
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, type(self)):
             raise NotImplementedError
-        return str(self) == str(other)
+        return self._connection_key() == other._connection_key()
+
 
+# Computed once, so serializing an endpoint does not need to walk and filter its __dict__
+ENDPOINT_FIELDS = tuple(field.name for field in dataclasses.fields(Endpoint))
 
 VALID_SERIAL_BAUDRATES = [
     3000000,
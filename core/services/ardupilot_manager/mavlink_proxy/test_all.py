@@ -58,6 +58,12 @@ def test_endpoint() -> None:
         "protected": False,
     }, "Endpoint dict does not match."
 
+    same_connection = Endpoint("Another endpoint", "pytest", EndpointType.UDPClient, "0.0.0.0", 14550)
+    assert endpoint == same_connection, "Endpoints with the same connection should be equal."
+    assert hash(endpoint) == hash(same_connection), "Endpoints with the same connection should have the same hash."
+    other_connection = Endpoint("Test endpoint", "pytest", EndpointType.UDPClient, "0.0.0.0", 14551)
+    assert endpoint != other_connection, "Endpoints with different connections should not be equal."
+
 
 def test_endpoint_validators() -> None:
     with pytest.raises(ValueError):
@@ -59,6 +59,7 @@ setuptools.setup(
         "fastapi-versioning == 0.9.1",
         "aiofiles == 0.6.0",
         "loguru == 0.5.3",
+        "pyudev == 0.22.0",
         "commonwealth == 0.1.0",
     ],
 )
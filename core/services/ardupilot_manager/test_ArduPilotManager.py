@@ -0,0 +1,178 @@
+# pylint: disable=redefined-outer-name
+import pathlib
+import subprocess
+import sys
+import time
+from typing import List
+from unittest import mock
+
+import pytest
+
+# import local library
+sys.path.append(str(pathlib.Path(__file__).absolute().parent))
+
+import ArduPilotManager as ArduPilotManagerModule
+from ArduPilotManager import ArduPilotManager
+from flight_controller_detector.Detector import Detector as BoardDetector
+from mavlink_proxy.Endpoint import Endpoint, EndpointType
+from Singleton import Singleton
+
+
+@pytest.fixture
+def settings() -> mock.MagicMock:
+    settings = mock.MagicMock()
+    settings.content = {}
+    return settings
+
+
+@pytest.fixture
+def mavlink_manager() -> mock.MagicMock:
+    manager = mock.MagicMock()
+    manager.endpoints.return_value = set()
+    return manager
+
+
+@pytest.fixture
+def autopilot(
+    monkeypatch: pytest.MonkeyPatch, settings: mock.MagicMock, mavlink_manager: mock.MagicMock
+) -> ArduPilotManager:
+    # Build a fresh instance through the real __init__, without touching the settings file or the router binaries
+    monkeypatch.setattr(Singleton, "_instances", {})
+    monkeypatch.setattr(ArduPilotManagerModule, "Settings", mock.MagicMock(return_value=settings))
+    monkeypatch.setattr(ArduPilotManagerModule, "MavlinkManager", mock.MagicMock(return_value=mavlink_manager))
+    monkeypatch.setattr(ArduPilotManagerModule, "FirmwareDownload", mock.MagicMock())
+    return ArduPilotManager()
+
+
+@pytest.fixture
+def endpoint() -> Endpoint:
+    return Endpoint("Test", "pytest", EndpointType.UDPClient, "0.0.0.0", 14551)
+
+
+def test_endpoints_batch_nested(
+    autopilot: ArduPilotManager, settings: mock.MagicMock, mavlink_manager: mock.MagicMock, endpoint: Endpoint
+) -> None:
+    with autopilot.endpoints_batch():
+        autopilot.add_new_endpoints({endpoint})
+        with autopilot.endpoints_batch():
+            autopilot.remove_endpoints({endpoint})
+            autopilot.add_new_endpoints({endpoint})
+        settings.save.assert_not_called()
+        mavlink_manager.restart.assert_not_called()
+
+    settings.save.assert_called_once()
+    mavlink_manager.restart.assert_called_once()
+
+
+def test_endpoints_batch_without_changes(
+    autopilot: ArduPilotManager, settings: mock.MagicMock, mavlink_manager: mock.MagicMock
+) -> None:
+    with autopilot.endpoints_batch():
+        with autopilot.endpoints_batch():
+            pass
+
+    settings.save.assert_not_called()
+    mavlink_manager.restart.assert_not_called()
+
+
+def test_endpoints_batch_exception(
+    autopilot: ArduPilotManager, settings: mock.MagicMock, mavlink_manager: mock.MagicMock, endpoint: Endpoint
+) -> None:
+    with pytest.raises(RuntimeError):
+        with autopilot.endpoints_batch():
+            autopilot.add_new_endpoints({endpoint})
+            raise RuntimeError("Failure inside the batch.")
+
+    settings.save.assert_called_once()
+    mavlink_manager.restart.assert_called_once()
+
+
+@pytest.fixture
+def board_detection(monkeypatch: pytest.MonkeyPatch, autopilot: ArduPilotManager) -> mock.MagicMock:
+    monkeypatch.setattr(ArduPilotManager, "check_running_as_root", mock.MagicMock())
+    monkeypatch.setattr(BoardDetector, "detect", mock.MagicMock(return_value=[]))
+    start_board = mock.MagicMock(side_effect=[False, True])
+    monkeypatch.setattr(autopilot, "start_board", start_board)
+    return start_board
+
+
+def test_run_with_board_waits_on_udev(
+    monkeypatch: pytest.MonkeyPatch, autopilot: ArduPilotManager, board_detection: mock.MagicMock
+) -> None:
+    # Only what pyudev.Monitor provides, a stop() call would fail here
+    monitor = mock.Mock(spec=["poll"])
+    sleep = mock.MagicMock()
+    monkeypatch.setattr(ArduPilotManager, "_tty_monitor", mock.MagicMock(return_value=monitor))
+    monkeypatch.setattr(time, "sleep", sleep)
+
+    autopilot.run_with_board()
+
+    assert board_detection.call_count == 2
+    monitor.poll.assert_called_once_with(timeout=2)
+    sleep.assert_not_called()
+
+
+def test_run_with_board_udev_failure(
+    monkeypatch: pytest.MonkeyPatch, autopilot: ArduPilotManager, board_detection: mock.MagicMock
+) -> None:
+    monitor = mock.Mock(spec=["poll"])
+    monitor.poll.side_effect = OSError("Netlink socket closed")
+    sleep = mock.MagicMock()
+    monkeypatch.setattr(ArduPilotManager, "_tty_monitor", mock.MagicMock(return_value=monitor))
+    monkeypatch.setattr(time, "sleep", sleep)
+
+    autopilot.run_with_board()
+
+    assert board_detection.call_count == 2
+    sleep.assert_called_once_with(2)
+
+
+class StopRestarting(Exception):
+    pass
+
+
+def keep_running_delays(
+    monkeypatch: pytest.MonkeyPatch, autopilot: ArduPilotManager, popen: mock.MagicMock, restarts: int
+) -> List[float]:
+    """Run the restart loop until it sleeps the given number of times, returning the slept delays."""
+    delays: List[float] = []
+
+    def sleep(delay: float) -> None:
+        delays.append(delay)
+        if len(delays) == restarts:
+            raise StopRestarting()
+
+    monkeypatch.setattr(subprocess, "Popen", popen)
+    monkeypatch.setattr(time, "sleep", sleep)
+    with pytest.raises(StopRestarting):
+        autopilot._keep_running(["ardusub"])
+    return delays
+
+
+def test_keep_running_backoff(monkeypatch: pytest.MonkeyPatch, autopilot: ArduPilotManager) -> None:
+    clock = [0.0]
+    monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+
+    def run_for(uptime: float) -> mock.MagicMock:
+        def wait() -> int:
+            clock[0] += uptime
+            return 1
+
+        return mock.MagicMock(wait=wait)
+
+    # Crashes right away eight times, then stays up long enough to be considered stable before crashing again
+    uptimes = [0.0] * 8 + [ArduPilotManager.STABLE_UPTIME + 1, 0.0]
+    popen = mock.MagicMock(side_effect=[run_for(uptime) for uptime in uptimes])
+
+    delays = keep_running_delays(monkeypatch, autopilot, popen, len(uptimes))
+
+    assert delays == [1, 2, 4, 8, 16, 32, 60, 60, 1, 2]
+
+
+def test_keep_running_start_failure(monkeypatch: pytest.MonkeyPatch, autopilot: ArduPilotManager) -> None:
+    popen = mock.MagicMock(side_effect=[OSError("Exec format error")] * 4)
+
+    delays = keep_running_delays(monkeypatch, autopilot, popen, 4)
+
+    assert popen.call_count == 4
+    assert delays == [1, 2, 4, 8]